@@ -0,0 +1,232 @@
+import heapq
+import itertools
+import numpy as np
+
+import utils as utils
+import policy_generation as policy_gen
+
+# Event types, in the order they are processed for each agent within a time step
+ARRIVE = 0  # agent arrives at an interaction node (split, target or heart node)
+DETECT = 1  # agent at the target detects it again, after listening to another agent there
+DEPART = 2  # agent takes its last step at an interaction node and moves on
+EXPIRE = 3  # agent's success bit times out
+MEET = 4  # agents at a node communicate (after an agent moves there, or something changed there)
+
+
+def sample_dwell(g, node):
+    """Sample the number of steps an agent spends at a node.
+    Each step there is a 1/(out_degree+1) chance of a self loop, so this is geometric."""
+    out_degree = len(g[node])
+    return int(np.random.geometric(out_degree/(out_degree+1)))
+
+
+def success_bit_at(s_ref, t_ref, t, L):
+    """Value of a success bit at the start of step t, given its value s_ref at the start of step t_ref
+    (while away from the target the bit counts up every step and resets to 0 when it reaches L)"""
+    if s_ref==0 or t<=t_ref:
+        return s_ref
+    s = s_ref + (t - t_ref)
+    if s>=L:
+        s = 0
+    return s
+
+
+def next_node(Si, node, splits, policy_bits, g, transitions):
+    """Find the node an agent moves to from its current node, according to its policy"""
+    if node in splits:  # if node is a split
+        ind = splits.index(node)  # find out which split
+        S_pol = Si[sum(policy_bits[0:ind]):sum(policy_bits[0:ind+1])]
+        S_pol_list = [str(int(s)) for s in S_pol]
+        S_pol_str = ''.join(S_pol_list)
+        for new_node in g[node]:  # find which node this policy goes to next
+            if transitions[node,new_node] == S_pol_str:
+                break
+    else:  # if node is not a split
+        new_node = g[node][0]  # just step forward to the only possible node
+
+    return new_node
+
+
+def sees(agent, enter, leave, other, t):
+    """Whether an agent that is at a node for steps [enter, leave) is seen there by another
+    agent that has just moved there in step t. Agents move one at a time in index order, so
+    agents with a lower index are already at their new node and the rest are still at their old one."""
+    if agent<=other:
+        return enter<=t+1<leave
+    return enter<=t<leave
+
+
+def node_at(route, t):
+    """Node an agent is at in time step t, from the (enter, leave, node) intervals of its current route"""
+    for enter, leave, node in route:
+        if enter<=t<leave:
+            return node
+    return None
+
+
+def occupy(occupancy, events, seq, node, enter, leave, agent, now, comm):
+    """Record that an agent is at a node for steps [enter, leave),
+    and schedule a meeting for any agent that will see another one when it moves there"""
+    occupancy[node] = [interval for interval in occupancy[node] if interval[1]>now]  # forget agents that have already left
+    if comm:
+        for other_enter, other_leave, other in occupancy[node]:
+            if other==agent:
+                continue
+            if sees(other, other_enter, other_leave, agent, enter-1):  # this agent moves in and sees the other
+                heapq.heappush(events, (enter-1, agent, MEET, next(seq), node))
+            if sees(agent, enter, leave, other, other_enter-1):  # the other moves in and sees this agent
+                heapq.heappush(events, (other_enter-1, other, MEET, next(seq), node))
+    occupancy[node].append((enter, leave, agent))
+
+
+def simulate(N, B, g, splits, policy_bits, transitions, node_policies, target, comm, L, delta, progress=None):
+    """
+    Event driven simulation of Bayesian particles.
+
+    Instead of stepping every agent every time step, each agent is only processed
+    at an interaction point: a split, the target, the heart node '0', or a node
+    where it meets another agent. Along a chain of non-split nodes the only random
+    event is the self loop, so the time spent at each node is drawn from a geometric
+    distribution and the agent jumps straight to the end of the chain. The success
+    bit is only evaluated when it is needed, since away from the target it just
+    counts up until it resets.
+
+    Agents at a node communicate whenever something there changes: an agent moves
+    in, a success bit turns on at the target or times out, or the last communication
+    changed an agent (run_simulation communicates after every agent's update, so a
+    group keeps communicating until nothing changes).
+
+    This is the noise free model (no false positives, false negatives or black holes).
+    Progress is reported to progress (a progress_server.ProgressServer), if given.
+
+    Output:
+        target_count = list, number of agents with a target policy at each time step
+    """
+    sbi = B-1  # success bit index
+    num_splits = len(splits)
+    interaction_nodes = set(splits) | {target, '0'}
+    threshold = 0.98*N
+
+    # Initialize agents
+    S = np.zeros((N,B),dtype=int)  # array to keep track of agents' polices and successes. each row represents an agent
+    for i in range(N):  # for each agent
+        S[i] = policy_gen.generate_random_policy(S[i],num_splits,node_policies,policy_bits)  # generate a random policy
+    agent_target_count = [False]*N
+    t_ref = [0]*N  # time step at which each agent's success bit was last evaluated
+    target_from = [0]*N  # time steps [target_from, target_until) each agent spends at the target
+    target_until = [0]*N
+    version = [0]*N  # used to ignore expiry events that are out of date
+    occupancy = {node: [] for node in g}  # (enter, leave, agent) for each agent at each node
+    route = [[] for i in range(N)]  # (enter, leave, node) for each node an agent is at until its next departure
+
+    events = []  # heap of (time step, agent, event type, sequence number, node or version)
+    seq = itertools.count()
+    for i in range(N):  # start every agent at node '0' (no success bits yet, so nothing to communicate)
+        dwell = sample_dwell(g, '0')
+        occupy(occupancy, events, seq, '0', 0, dwell, i, 0, False)
+        route[i] = [(0, dwell, '0')]
+        heapq.heappush(events, (0, i, ARRIVE, next(seq), ('0', dwell)))
+
+    target_pol_count = 0
+    target_count = []  # list to store number of agents that have policies that pass the target
+    met = set()  # meetings already handled in this time step
+    while True:
+        t = events[0][0]
+
+        # Nothing changes between events, so record the count for every step up to this one
+        if len(target_count) < t:
+            if target_pol_count >= threshold:
+                target_count.append(target_pol_count)
+                break
+            target_count.extend([target_pol_count]*(t-len(target_count)))
+            met = set()
+            if progress is not None:
+                progress.step(len(target_count), target_pol_count/N)
+
+        t, i, event, _, x = heapq.heappop(events)
+
+        if event==ARRIVE:  # x is the node the agent arrives at and the number of steps it stays there
+            node, dwell = x
+            if node==target:  # detect the target every step spent there
+                if comm and dwell>1 and success_bit_at(S[i,sbi], t_ref[i], t, L)==0:  # success bit turns on, so others there may listen
+                    heapq.heappush(events, (t, i, MEET, next(seq), node))
+                if not agent_target_count[i]:
+                    agent_target_count[i] = True
+                    target_pol_count += 1
+                S[i,sbi] = 1
+                t_ref[i] = t+dwell
+                target_from[i] = t
+                target_until[i] = t+dwell
+                version[i] += 1
+                heapq.heappush(events, (t+dwell+L-2, i, EXPIRE, next(seq), version[i]))
+            heapq.heappush(events, (t+dwell-1, i, DEPART, next(seq), node))
+
+        elif event==DETECT:
+            if not agent_target_count[i]:
+                agent_target_count[i] = True
+                target_pol_count += 1
+
+        elif event==DEPART:  # x is the node the agent leaves
+            if x=='0':
+                S[i,sbi] = success_bit_at(S[i,sbi], t_ref[i], t, L)
+                t_ref[i] = max(t, t_ref[i])
+                if S[i,sbi]==0:  # if unsuccessful and at heart node, generate new policy
+                    S[i] = policy_gen.generate_random_policy(S[i],num_splits,node_policies,policy_bits)
+
+            # Jump along the chain of non-split nodes to the next interaction node
+            node = next_node(S[i], x, splits, policy_bits, g, transitions)
+            t_arrive = t+1
+            route[i] = []
+            while node not in interaction_nodes:
+                dwell = sample_dwell(g, node)
+                occupy(occupancy, events, seq, node, t_arrive, t_arrive+dwell, i, t, comm)
+                route[i].append((t_arrive, t_arrive+dwell, node))
+                t_arrive += dwell
+                node = g[node][0]
+            dwell = sample_dwell(g, node)
+            occupy(occupancy, events, seq, node, t_arrive, t_arrive+dwell, i, t, comm)
+            route[i].append((t_arrive, t_arrive+dwell, node))
+            heapq.heappush(events, (t_arrive, i, ARRIVE, next(seq), (node, dwell)))
+
+        elif event==EXPIRE:  # x is the version of the agent's success bit
+            if x==version[i]:
+                S[i,sbi] = 0
+                t_ref[i] = t+1
+                if agent_target_count[i]:
+                    agent_target_count[i] = False
+                    target_pol_count -= 1
+                if comm:  # it may now listen to an agent it shares a node with
+                    heapq.heappush(events, (t, i, MEET, next(seq), node_at(route[i], t+1)))
+
+        elif event==MEET:  # x is the node where agents communicate, after agent i's update
+            if (i, x) in met:
+                continue
+            met.add((i, x))
+            indices = sorted(set(j for enter, leave, j in occupancy[x] if sees(j, enter, leave, i, t)))
+            if len(indices)<2:
+                continue
+
+            for j in indices:  # evaluate success bits as they are after agent i's update
+                t_j = t+1 if j<=i else t
+                S[j,sbi] = success_bit_at(S[j,sbi], t_ref[j], t_j, L)
+                t_ref[j] = max(t_j, t_ref[j])
+            before = [agent_target_count[j] for j in indices]
+            S_before = S[indices].copy()
+            S, agent_target_count = utils.communicate_group(S, indices, agent_target_count, delta, splits, policy_bits, g, transitions)
+
+            for j, counted, s_before in zip(indices, before, S_before):
+                if (S[j]==s_before).all():
+                    continue
+                t_j = t+1 if j<=i else t
+                if target_from[j]<=t_j<target_until[j]:  # agents at the target detect it again in their next update
+                    S[j,sbi] = 1
+                    heapq.heappush(events, (t_j, j, DETECT, next(seq), None))
+                else:  # success bit was recharged, so reschedule its expiry
+                    version[j] += 1
+                    heapq.heappush(events, (t_ref[j]+L-S[j,sbi]-1, j, EXPIRE, next(seq), version[j]))
+                target_pol_count += agent_target_count[j] - counted
+
+            if (S[indices]!=S_before).any():  # communicate again after the next agent's update
+                heapq.heappush(events, (t, i+1, MEET, next(seq), x) if i+1<N else (t+1, 0, MEET, next(seq), x))
+
+    return target_count
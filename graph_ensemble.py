@@ -0,0 +1,121 @@
+import multiprocessing
+import click
+import numpy as np
+import networkx as nx
+
+import graph_generation as graph_gen
+
+
+def ensemble_file(ensemble_path):
+    """Path of an ensemble archive (np.savez_compressed adds .npz to paths without it)"""
+    return ensemble_path if ensemble_path.endswith('.npz') else ensemble_path + '.npz'
+
+
+def generate_graph(args):
+    """Generate one graph of an ensemble from its seed"""
+    seed, num_nodes, degree, c = args
+    np.random.seed(seed)
+    G, g, entropy, A, paths, max_cycle_length = graph_gen.create_graph(num_nodes, degree, c)
+    return A, entropy, paths, max_cycle_length
+
+
+def graph_statistics(A):
+    """
+    Find the policy space of a graph from its adjacency matrix, without enumerating policies.
+
+    Outputs:
+        num_splits = int, number of diverging nodes
+        B = int, number of bits (same as policy_generation.analyze_graph)
+        log2_policies = float, log2 of the number of possible policies
+    """
+    out_degree = A.sum(axis=1)
+    split_degree = out_degree[out_degree>1]  # outgoing edges of each split
+    num_splits = len(split_degree)
+    B = 1 + int(np.sum(np.ceil(np.log2(split_degree))))  # 1 success bit plus policy bits for each split
+    log2_policies = float(np.sum(np.log2(split_degree)))  # one policy for each combination of branches
+
+    return num_splits, B, log2_policies
+
+
+def create_ensemble(ensemble_path, num_graphs, num_nodes, degree=2, c=3, seed=0, num_workers=None):
+    """
+    Generate num_graphs random graphs in parallel and save them, with their statistics,
+    to a compressed archive. Graph k is generated from seed+k.
+
+    The adjacency matrices are stored as edge lists: the edges of graph k are
+    edge_src[edge_ptr[k]:edge_ptr[k+1]] -> edge_dst[edge_ptr[k]:edge_ptr[k+1]].
+    Every other array has one entry per graph, indexed by graph id.
+    """
+    seeds = np.arange(seed, seed+num_graphs)
+    with multiprocessing.Pool(num_workers) as pool:
+        graphs = pool.map(generate_graph, [(int(s), num_nodes, degree, c) for s in seeds])
+
+    edge_ptr = np.zeros(num_graphs+1, dtype=np.int64)
+    edge_src, edge_dst = [], []
+    entropy, paths, max_cycle_length = np.zeros(num_graphs), np.zeros(num_graphs, dtype=np.int64), np.zeros(num_graphs, dtype=np.int64)
+    num_splits, bits, log2_policies = np.zeros(num_graphs, dtype=np.int64), np.zeros(num_graphs, dtype=np.int64), np.zeros(num_graphs)
+    for k, (A, h, p, max_length) in enumerate(graphs):
+        src, dst = np.nonzero(A)
+        edge_src.append(src)
+        edge_dst.append(dst)
+        edge_ptr[k+1] = edge_ptr[k] + len(src)
+        entropy[k], paths[k], max_cycle_length[k] = h, p, max_length
+        num_splits[k], bits[k], log2_policies[k] = graph_statistics(A)
+
+    np.savez_compressed(ensemble_file(ensemble_path),
+                        num_nodes=num_nodes, degree=degree, c=c, seeds=seeds,
+                        edge_ptr=edge_ptr,
+                        edge_src=np.concatenate(edge_src).astype(np.int32),
+                        edge_dst=np.concatenate(edge_dst).astype(np.int32),
+                        entropy=entropy, paths=paths, max_cycle_length=max_cycle_length,
+                        num_splits=num_splits, bits=bits, log2_policies=log2_policies)
+
+
+def load_ensemble(ensemble_path):
+    """Load an ensemble archive as a dictionary of arrays"""
+    with np.load(ensemble_file(ensemble_path)) as data:
+        return {key: data[key] for key in data.files}
+
+
+def load_graph(ensemble, graph_id):
+    """Rebuild a graph of an ensemble by id, in the same format as graph_generation.create_graph"""
+    num_graphs = len(ensemble["seeds"])
+    if not 0 <= graph_id < num_graphs:
+        raise ValueError(f"graph_id must be between 0 and {num_graphs-1}, got {graph_id}")
+    num_nodes = int(ensemble["num_nodes"])
+    edges = slice(ensemble["edge_ptr"][graph_id], ensemble["edge_ptr"][graph_id+1])
+
+    A = np.zeros((num_nodes,num_nodes), dtype=int)
+    A[ensemble["edge_src"][edges], ensemble["edge_dst"][edges]] = 1
+
+    g = {}
+    for i in range(num_nodes):  # for each row (node) in the matrix (graph)
+        g[str(i)] = [str(j) for j in range(num_nodes) if A[i,j]==1]  # save outgoing nodes
+    G = nx.from_numpy_array(A, create_using = nx.MultiDiGraph())  # generate graph from adjacency matrix
+
+    return(G, g, ensemble["entropy"][graph_id], A, int(ensemble["paths"][graph_id]), int(ensemble["max_cycle_length"][graph_id]))
+
+
+@click.command()
+@click.option('--ensemble_path', default='ensemble.npz', help='File to save the ensemble to.')
+@click.option('--num_graphs', default=1000, help='The number of randomly generated graphs.')
+@click.option('--num_nodes', default=10, help='The number of nodes in each graph.')
+@click.option('--degree', default=2., help='The expected number of outgoing edges per node.')
+@click.option('--c', default=3., help='Constant for ensuring max cycle length <= c * log(n) (n = number of nodes).')
+@click.option('--seed', default=0, help='Seed of the first graph. Graph k is generated from seed+k.')
+@click.option('--num_workers', default=None, type=int, help='The number of processes (default = number of CPUs).')
+def create_ensemble_cli(ensemble_path, num_graphs, num_nodes, degree, c, seed, num_workers):
+    """Generate an ensemble of random graphs and print a summary of their statistics"""
+    if not 0 < degree < num_nodes:
+        raise click.BadParameter(f"must be between 0 and num_nodes={num_nodes} (exclusive), got {degree}", param_hint="'--degree'")
+    create_ensemble(ensemble_path, num_graphs, num_nodes, degree, c, seed, num_workers)
+
+    ensemble = load_ensemble(ensemble_path)
+    print(f"Saved {num_graphs} graphs to {ensemble_file(ensemble_path)}")
+    for stat in ["entropy", "paths", "max_cycle_length", "num_splits", "bits", "log2_policies"]:
+        values = ensemble[stat]
+        print(f"{stat}: mean {np.mean(values):.3f}, min {np.min(values)}, max {np.max(values)}")
+
+
+if __name__ == "__main__":
+    create_ensemble_cli()
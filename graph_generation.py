@@ -21,12 +21,15 @@ def dfs(visited, graph, node):
     return paths, max_length
 
 
-def create_graph(N):  # N = number of nodes in a random graph
-    """Create a random Circulative Network"""
+def create_graph(N, degree=2, c=3):  # N = number of nodes in a random graph
+    """Create a random Circulative Network.
+    degree = expected number of outgoing edges per node before dead ends are fixed,
+    c = constant for ensuring max cycle length <= c * log(N)"""
+    if not 0 < degree < N:  # degree/N is the chance of each edge
+        raise ValueError(f"degree must be between 0 and N={N} (exclusive), got {degree}")
 
     # Parameters
     outgoing_threshold = 5  # max number of outgoing edges
-    c = 3  # constant for ensuring max cycle length <= c * log(N)
     max_cycle_length = float('inf')  # initialize variable for while loop
     g = {}  # initialize graph dictionary
 
@@ -38,7 +41,7 @@ def create_graph(N):  # N = number of nodes in a random graph
         max_length = 0
 
         # Define adjacency matrix
-        A_0 = np.random.choice([0,1], p=[(1-2/N), (2/N)],size=(N,N))  # start with randomly generated adjacency matrix
+        A_0 = np.random.choice([0,1], p=[(1-degree/N), (degree/N)],size=(N,N))  # start with randomly generated adjacency matrix
         A = np.triu(A_0,1)  # make the matrix upper trianglar so the graph flows "forward"
         A[:,0]=A_0[:,0]   # but allow nodes to return to initial node (0)
 
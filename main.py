@@ -8,19 +8,30 @@ import matplotlib.pyplot as plt
 
 import utils as utils
 import graph_generation as graph_gen
+import graph_ensemble as graph_ens
+import event_simulation as event_sim
 import policy_generation as policy_gen
 from plot_output_data import plot_output_data
+from progress_server import ProgressServer
 
 
-def calculate_parameters(g, M, policy_paths, num_policies, target):
-    """Calculate q (the probability of passing by the target) and N (the number of agents required)"""
-    target_policies = utils.find_target_policies(policy_paths,[target])  # find which policies will bypass the target (not used in simulation, just to print)
-    q = utils.chance_of_target(g, policy_paths, target)  # probability of passing by the target
-    print(f"Chance of finding the target: {q}")
+def generate_policies(g):
+    """Analyze a graph and find every policy that can be used to search it"""
+    split_dict, splits, B = policy_gen.analyze_graph(g)  # analyze graph
+    policy_bits = policy_gen.define_policy_structure(split_dict)  # find policy structure
+    transitions, node_policies = policy_gen.assign_policies_to_nodes(split_dict, policy_bits, g)  # assign policies to graph transitions
+    full_policies = policy_gen.find_full_policies(node_policies, len(splits))  # find full list of all possible policies
+    policy_paths = policy_gen.find_node_paths(full_policies, splits, g, transitions, policy_bits)  # find sequence of nodes that each policy passes through
+
+    return split_dict, splits, B, policy_bits, transitions, node_policies, full_policies, policy_paths
+
+
+def calculate_parameters(A, M):
+    """Calculate q (the probability of passing by each node) and N (the number of agents required for a target at each node)"""
+    q = utils.chance_of_targets(A)  # probability of passing by each node
 
     gamma = 1.
-    N = int((gamma/q) + np.log2(M)**2)
-    print(f"Number of agents required for this graph: {N}")
+    N = ((gamma/q) + np.log2(M)**2).astype(int)
 
     return q, N
 
@@ -44,7 +55,7 @@ def record_results_csv(M, A, N, B, comm, target, q, z_fp, z_fn, target_count, fi
         writer.writerow([])
 
 
-def run_simulation(M, G, g, A, P, B, splits, policy_bits, transitions, node_policies, full_policies, policy_paths, paths, target, q, N, first_trial, output_path):
+def run_simulation(M, G, g, A, P, B, splits, policy_bits, transitions, node_policies, full_policies, policy_paths, paths, target, q, N, first_trial, output_path, progress=None):
     # Parameters
     comm = True  # agent communication (true = bayesian particle algorithm. false = independent agents searching)
     z_fp = 0.0  # probability of false positive
@@ -146,18 +157,47 @@ def run_simulation(M, G, g, A, P, B, splits, policy_bits, transitions, node_poli
         # Count Policies
         target_pol_count = sum(agent_target_count)
         target_count.append(target_pol_count)  # number of successful agents at this time
+        if progress is not None:
+            progress.step(len(target_count), target_pol_count/N)
+    print(f"Converged in {len(target_count)} steps")
+
+    # Record results to a csv file
+    record_results_csv(M, A, N, B, comm, target, q, z_fp, z_fn, target_count, first_trial, output_path)
+
+    return target_count
+
+
+def run_event_simulation(M, G, g, A, P, B, splits, policy_bits, transitions, node_policies, full_policies, policy_paths, paths, target, q, N, first_trial, output_path, progress=None):
+    """Same as run_simulation, but only processes agents at splits, the target, the heart node, or when they meet"""
+    # Parameters
+    comm = True  # agent communication (true = bayesian particle algorithm. false = independent agents searching)
+    z_fp = 0.0  # probability of false positive (the event driven simulation is noise free)
+    z_fn = 0.0  # probability of false negative
+    L = 3*12  # number of steps without detecting target before success bit resets
+    delta = 2*12  # the amount the success bit "charges"
+
+    # Simulate Bayesian Particles
+    target_count = event_sim.simulate(N, B, g, splits, policy_bits, transitions, node_policies, target, comm, L, delta, progress)
     print(f"Converged in {len(target_count)} steps")
 
     # Record results to a csv file
     record_results_csv(M, A, N, B, comm, target, q, z_fp, z_fn, target_count, first_trial, output_path)
 
+    return target_count
+
 
 @click.command()
 @click.option('--num_nodes', default=10, help='The number of nodes in the randomly generated graph')
 @click.option('--num_targets', default=1, help='The number of targets. Must be less than n-1 (n = number of nodes).')
 @click.option('--num_trials', default=10, help='The number of simulations to run for each target.')
 @click.option('--no_output_plot', type=bool, default=False, help='Boolean flag for whether or not to plot output data. Add this to NOT plot the data.')
-def main(num_nodes, num_targets, num_trials, no_output_plot):
+@click.option('--event_driven', is_flag=True, default=False, help='Flag to use the event driven simulation, which skips agents between interaction points.')
+@click.option('--ensemble_path', default=None, help='Graph ensemble file (from graph_ensemble.py) to load the graph from, instead of generating one.')
+@click.option('--graph_id', default=0, help='Id of the graph in the ensemble.')
+@click.option('--target_order', type=click.Choice(['random', 'hardest', 'easiest']), default='random', help='Place targets at random nodes, or at the nodes that are hardest or easiest to find (lowest or highest q).')
+@click.option('--progress_port', default=None, type=int, help='Stream live progress over HTTP on this local port (0 = any free port).')
+@click.option('--progress_socket', default=None, help='Stream live progress over HTTP on this Unix socket.')
+def main(num_nodes, num_targets, num_trials, no_output_plot, event_driven, ensemble_path, graph_id, target_order, progress_port, progress_socket):
     """Function to generate a random graph and target location, and simulate agents finding the target"""
 
     # Create a folder to save the output data to
@@ -167,33 +207,60 @@ def main(num_nodes, num_targets, num_trials, no_output_plot):
     if not os.path.exists(output_path):
         os.mkdir(output_path)
 
-    # Generate graph
-    G, g, entropy, A, paths, max_cycle_length = graph_gen.create_graph(num_nodes)
+    # Generate graph (or load it from an ensemble)
+    if ensemble_path is None:
+        G, g, entropy, A, paths, max_cycle_length = graph_gen.create_graph(num_nodes)
+    else:
+        G, g, entropy, A, paths, max_cycle_length = graph_ens.load_graph(graph_ens.load_ensemble(ensemble_path), graph_id)
+        num_nodes = len(g)
     print(f"\nThere are {paths} paths in this graph. \nThe maximum cycle length is {max_cycle_length}.")  # number of paths counted
 
     # Generate Policies
-    split_dict, splits, B = policy_gen.analyze_graph(g)  # analyze graph
-    policy_bits = policy_gen.define_policy_structure(split_dict)  # find policy structure
-    transitions, node_policies = policy_gen.assign_policies_to_nodes(split_dict, policy_bits, g)  # assign policies to graph transitions
-    full_policies = policy_gen.find_full_policies(node_policies, len(splits))  # find full list of all possible policies
-    policy_paths = policy_gen.find_node_paths(full_policies, splits, g, transitions, policy_bits)  # find sequence of nodes that each policy passes through
+    split_dict, splits, B, policy_bits, transitions, node_policies, full_policies, policy_paths = generate_policies(g)
+
+    # Find q and N for a target at every node
+    q_list, N_list = calculate_parameters(A, num_nodes)
 
-    # Randomly place the target at a (non-heart) node in the graph
+    # Place the targets at (non-heart) nodes in the graph
     target_list = []
-    for ttt in range(num_targets):
-        target = str(np.random.choice(np.arange(1, num_nodes-1)))
-        while target in target_list:
+    if target_order=='random':
+        for ttt in range(num_targets):
             target = str(np.random.choice(np.arange(1, num_nodes-1)))
-        target_list.append(target)
+            while target in target_list:
+                target = str(np.random.choice(np.arange(1, num_nodes-1)))
+            target_list.append(target)
+    else:
+        ranked_nodes = np.argsort(q_list[1:num_nodes-1], kind='stable') + 1  # from hardest to easiest to find
+        if target_order=='easiest':
+            ranked_nodes = ranked_nodes[::-1]
+        target_list = [str(node) for node in ranked_nodes[:num_targets]]
+
+    # Optionally stream live progress
+    progress = None
+    if progress_port is not None or progress_socket is not None:
+        progress = ProgressServer(len(target_list)*num_trials, port=progress_port, unix_path=progress_socket)
+        progress.start()
+
+    for target in target_list:
         print(f"\nTarget at {target}")
+        q, N = float(q_list[int(target)]), int(N_list[int(target)])
+        print(f"Chance of finding the target: {q}")
+        print(f"Number of agents required for this graph: {N}")
 
         # Run simulation
-        q, N = calculate_parameters(g, num_nodes, policy_paths, len(full_policies), target)
         first_trial = True
-        for _ in range(num_trials):
-            run_simulation(num_nodes, G, g, A, split_dict, B, splits, policy_bits, transitions, node_policies, full_policies, policy_paths, paths, target, q, N, first_trial, output_path)
+        simulate = run_event_simulation if event_driven else run_simulation
+        for trial in range(num_trials):
+            if progress is not None:
+                progress.trial_started(target, trial, N)
+            target_count = simulate(num_nodes, G, g, A, split_dict, B, splits, policy_bits, transitions, node_policies, full_policies, policy_paths, paths, target, q, N, first_trial, output_path, progress)
+            if progress is not None:
+                progress.trial_finished(len(target_count))
             first_trial = False
 
+    if progress is not None:
+        progress.stop()
+
     # Optionally plot output data
     if not no_output_plot:
         plot_output_data(output_path)
@@ -1,11 +1,18 @@
 import os
+import io
+import re
 import csv
 import sys
+import json
+import hashlib
 import click
 import numpy as np
 import matplotlib.pyplot as plt
 import networkx as nx
 
+CACHE_FILENAME = ".aggregate_cache.json"  # parsed trials, saved in the output folder
+PREFIX_CHECK_BYTES = 4096  # bytes before the cached offset that are hashed to check a file was only appended to
+
 # csv file format: graph_filename, entropy, nodes, agents, t_75, t_90, t_95, t_99, bits, rho, target, list
 def string_to_list(row):
    """Convert the string of comma-seperated data into a list"""
@@ -59,7 +66,98 @@ def parse_csv_filename(file_path):
     return int(M), int(p), int(t)
 
 
-def plot_output_data(output_path):
+def load_aggregate_cache(output_path):
+    """Load the cache of parsed trials saved next to the results"""
+    cache_file = os.path.join(output_path, CACHE_FILENAME)
+    if not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file) as file:
+            return json.load(file)
+    except ValueError:  # corrupted cache, start again
+        return {}
+
+
+def save_aggregate_cache(output_path, cache):
+    """Save the cache of parsed trials next to the results"""
+    cache_file = os.path.join(output_path, CACHE_FILENAME)
+    with open(cache_file + ".tmp", 'w') as file:
+        json.dump(cache, file)
+    os.replace(cache_file + ".tmp", cache_file)  # never leave a partly written cache
+
+
+def update_aggregate(cache, file_path, M, agent_increments):
+    """
+    Parse the trials added to a csv file since it was cached and merge them into its cache entry.
+
+    Each entry is keyed by file size and mtime. Files are only appended to, so only
+    the bytes after the last complete trial are read. If the bytes just before them
+    changed (the file was rewritten) or the file shrunk, it is parsed again from the start.
+
+    Cache entry:
+        A = adjacency matrix
+        agents, counts = number of agents, and number of successful agents at each timestep, for each trial
+        time_sums, time_counts = running sum and count of the first timestep each trial reaches each portion of agent_increments
+    """
+    name = os.path.basename(file_path)
+    stat = os.stat(file_path)
+
+    entry = cache.get(name)
+    if entry is not None and entry["size"]==stat.st_size and entry["mtime"]==stat.st_mtime:  # unchanged
+        return entry
+
+    with open(file_path, 'rb') as file:
+        prefix = b''
+        if entry is not None and stat.st_size>=entry["offset"]:  # check the parsed part of the file is unchanged
+            file.seek(max(entry["offset"]-PREFIX_CHECK_BYTES, 0))
+            prefix = file.read(min(entry["offset"], PREFIX_CHECK_BYTES))
+        if entry is None or stat.st_size<entry["offset"] or hashlib.sha1(prefix).hexdigest()!=entry.get("prefix_hash"):  # new or rewritten file (or an old cache)
+            prefix = b''
+            entry = {"size": 0, "mtime": 0, "offset": 0, "prefix_hash": hashlib.sha1(prefix).hexdigest(), "A": None, "agents": [], "counts": [],
+                     "time_sums": [0]*len(agent_increments), "time_counts": [0]*len(agent_increments)}
+            cache[name] = entry
+
+        # Read new data, up to the end of the last complete trial (each trial ends with an empty row)
+        file.seek(entry["offset"])
+        new_data = file.read()
+    trial_ends = [match.end() for match in re.finditer(rb"\n\r?\n", new_data)]
+    if trial_ends:
+        new_data = new_data[:trial_ends[-1]]
+        filereader = csv.reader(io.StringIO(new_data.decode(), newline=''), delimiter=' ', quotechar='|')
+        data_list = []
+        for row in filereader:
+            if entry["A"] is None:  # the first row is the adjacency matrix
+                entry["A"] = row_to_array(M, row).tolist()
+                continue
+            elif len(row)>0 and row[0]=="data":  # reformat csv data for this row
+                data_list.append(string_to_list(row))
+            else:
+                data_list.append(row)
+
+            if len(data_list)==9:
+                # Read the data
+                N = int(data_list[0][0])  # agents
+                agent_count_xN = data_list[7]  # total number of agents that have detected the target
+                entry["agents"].append(N)
+                entry["counts"].append(agent_count_xN)
+
+                # Update the time each portion of agents was reached
+                agent_count = [count/N for count in agent_count_xN]
+                for ind, agent_portion in enumerate(agent_increments):
+                    for timestep, trial_agent_portion in enumerate(agent_count):
+                        if trial_agent_portion>=agent_portion:
+                            entry["time_sums"][ind] += timestep
+                            entry["time_counts"][ind] += 1
+                            break
+                data_list=[]
+        entry["offset"] += len(new_data)
+        entry["prefix_hash"] = hashlib.sha1((prefix + new_data)[-PREFIX_CHECK_BYTES:]).hexdigest()
+
+    entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+    return entry
+
+
+def plot_output_data(output_path, use_cache=True):
     """Read data from csv files and plot."""
 
     # Search directory for csv files
@@ -75,71 +173,43 @@ def plot_output_data(output_path):
 
     plt.figure(figsize=(10,7))
 
+    # Parse only the trials added since the last time, using the cache saved next to the results
+    agent_increments = np.linspace(0, 1, 10)
+    cache = load_aggregate_cache(output_path) if use_cache else {}
+    cache = {name: cache[name] for name in cache if name in [os.path.basename(file) for file in filename_list]}  # forget deleted files
+
     f=-1
     avg_agents_per_target = []
     agent_increments_per_target = []
+    color_palette_dark = plt.cm.Set1
+    color_palette_light = plt.cm.Pastel1
     for filename in filename_list:
         M, _, _ = parse_csv_filename(filename)
+        entry = update_aggregate(cache, filename, M, agent_increments)
+        A = np.array(entry["A"])  # adjacency matrix
 
-        agent_count_lists = []
         f+=1
-        with open(filename, newline='') as csvfile:
-            filereader = csv.reader(csvfile, delimiter=' ', quotechar='|')
-            data_list = []
-            line_count = -1
-            row_count = 0  # initialize row counter
-            for row in filereader:
-                if row_count==0: # the first row is the adjacency matrix
-                    A = row_to_array(M, row)
-                    row_count+=1
-                elif len(row)>0 and row[0]=="data":  # reformat csv data for this row
-                    data = string_to_list(row)
-                    data_list.append(data)
-                else:
-                    data = [item for item in row]
-                    data_list.append(data)
-
-                line_count += 1
-                if line_count==9:
-                    # Read the data
-                    N = int(data_list[0][0])  # agents
-                    B = int(data_list[1][0])  # bits
-                    comm = str(data_list[2][0])  # commm
-                    target = int(data_list[3][0])  # target
-                    q = float(data_list[4][0])  # q
-                    p_fp = float(data_list[5][0])  # probablilty of false positive
-                    p_fn = float(data_list[6][0])  # probablilty of false negative
-                    agent_count_xN = data_list[7]  # total number of agents that have detected the target
-                    agent_count = [count/N for count in agent_count_xN]  # portion of agents that have detected the target
-                    agent_count_lists.append(agent_count)
-
-                    # Plot the number of successful agents at each timestep
-                    num_timesteps = len(agent_count)
-                    color_palette_dark = plt.cm.Set1
-                    color_palette_light = plt.cm.Pastel1
-                    plt.plot(range(num_timesteps), agent_count, color=color_palette_light(f), alpha=0.2, marker='.')
-
-                    data_list=[]
-                    line_count=0
-
-        # Calculate averages for all of the trials for each target location
+        agent_count_lists = []
+        for N, agent_count_xN in zip(entry["agents"], entry["counts"]):  # for each trial
+            agent_count = [count/N for count in agent_count_xN]  # portion of agents that have detected the target
+            agent_count_lists.append(agent_count)
+
+            # Plot the number of successful agents at each timestep
+            num_timesteps = len(agent_count)
+            plt.plot(range(num_timesteps), agent_count, color=color_palette_light(f), alpha=0.2, marker='.')
+
+        # Averages for all of the trials for each target location
         total_time_per_trial = [len(trial) for trial in agent_count_lists]
         max_time_per_trial = max(total_time_per_trial)
 
-        average_agent_count = []
-        agent_increments = np.linspace(0, 1, 10)
-        for agent_portion in agent_increments:  # for each number of agents
-            agent_portion_timesteps = []
-            for trial in agent_count_lists:  # for each trial in this simulation
-                for timestep, trial_agent_portion in enumerate(trial):
-                    if trial_agent_portion>=agent_portion:
-                        agent_portion_timesteps.append(timestep)
-                        break
-            average_agent_count.append(np.mean(agent_portion_timesteps))
+        average_agent_count = [time_sum/time_count if time_count>0 else np.nan for time_sum, time_count in zip(entry["time_sums"], entry["time_counts"])]
 
         avg_agents_per_target.append(average_agent_count)
         agent_increments_per_target.append(agent_increments)
 
+    if use_cache:
+        save_aggregate_cache(output_path, cache)
+
     # Plot averages
     for targ in range(len(filename_list)):
         num_entries = len(avg_agents_per_target[targ])
@@ -176,8 +246,9 @@ plt.show()
 
 @click.command()
 @click.option('-o', '--output_path', help='Path to the output data.')
-def plot_output_data_cli(output_path):
-    plot_output_data(output_path)
+@click.option('--no_cache', is_flag=True, default=False, help='Flag to parse every file again instead of using the cache of parsed trials.')
+def plot_output_data_cli(output_path, no_cache):
+    plot_output_data(output_path, use_cache=not no_cache)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import collections
+
+SUBSCRIBER_QUEUE_SIZE = 100  # messages kept for a subscriber that is slow to read, before the oldest are dropped
+
+
+class ProgressServer:
+    """
+    Stream live progress of running simulations over HTTP (on a local port or a Unix socket).
+
+    The simulation loop only appends raw updates to a deque, which is thread safe
+    without locks, and progress updates are throttled to one every `interval` seconds.
+    A background thread running an asyncio server drains the deque, works out steps/sec,
+    the success fraction and the ETA, and sends them to every subscriber.
+
+    Endpoints:
+        GET /status = JSON snapshot of the latest progress
+        GET /events = server-sent events, one JSON message per update
+    """
+
+    def __init__(self, num_trials, port=None, unix_path=None, interval=0.25):
+        self.num_trials = num_trials  # total number of trials in this run, or claimed so far by a sweep worker (for the ETA)
+        self.port = port
+        self.unix_path = unix_path
+        self.interval = interval
+
+        self.updates = collections.deque()  # raw updates from the simulation loop
+        self.last_step_time = 0.
+        self.subscribers = set()
+        self.handlers = set()  # requests being answered
+        self.status = {"trials_finished": 0, "trials_total": num_trials}
+        self.trial_durations = []
+        self.trial_start_time = None  # None when no trial is running
+        self.last_progress = None  # (time, steps) of the last progress update
+
+    # Called from the simulation loop
+
+    def trial_started(self, target, trial, N):
+        self.updates.append(("trial_started", time.monotonic(), target, trial, N))
+
+    def step(self, steps, success_fraction):
+        now = time.monotonic()
+        if now - self.last_step_time >= self.interval:  # throttle so the simulation loop isn't slowed down
+            self.last_step_time = now
+            self.updates.append(("progress", now, steps, success_fraction))
+
+    def trial_finished(self, steps):
+        self.updates.append(("trial_finished", time.monotonic(), steps))
+
+    def add_trials(self, num_trials):
+        """Add trials to the total (e.g. when a sweep worker claims a job)"""
+        self.updates.append(("trials_added", time.monotonic(), num_trials))
+
+    # Server
+
+    def start(self):
+        """Start the server in a background thread"""
+        self.started = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=asyncio.run, args=(self.serve(),), daemon=True)
+        self.thread.start()
+        self.started.wait()
+        if self.error is not None:  # e.g. the port is already in use
+            raise self.error
+        print(f"Streaming progress at {self.address}")
+
+    def stop(self):
+        """Send any remaining updates, close all subscriptions and stop the server"""
+        self.loop.call_soon_threadsafe(self.stopping.set)
+        self.thread.join()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        try:
+            if self.unix_path is not None:
+                server = await asyncio.start_unix_server(self.handle, path=self.unix_path)
+                self.address = f"unix:{self.unix_path}"
+            else:
+                server = await asyncio.start_server(self.handle, host='127.0.0.1', port=self.port)
+                self.address = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        except Exception as error:  # pass it on to start(), so it doesn't wait forever
+            self.error = error
+            return
+        finally:
+            self.started.set()
+
+        async with server:
+            while not self.stopping.is_set():
+                self.drain()
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            self.drain()
+            self.publish({"event": "done"})
+            self.publish(None)  # end of stream
+            if self.handlers:
+                await asyncio.wait(self.handlers, timeout=1)  # let subscribers send their last messages
+
+        if self.unix_path is not None and os.path.exists(self.unix_path):
+            os.remove(self.unix_path)
+
+    def drain(self):
+        """Turn the raw updates from the simulation loop into messages for subscribers"""
+        while self.updates:
+            update = self.updates.popleft()
+            kind, now = update[0], update[1]
+
+            if kind=="trials_added":
+                self.num_trials += update[2]
+                self.status["trials_total"] = self.num_trials
+                message = {"event": kind, "trials_total": self.num_trials}
+
+            elif kind=="trial_started":
+                _, _, target, trial, N = update
+                self.trial_start_time = now
+                self.last_progress = (now, 0)
+                self.status.update({"target": target, "trial": trial, "agents": N, "steps": 0, "success_fraction": 0.})
+                message = {"event": kind, "target": target, "trial": trial, "agents": N}
+
+            elif kind=="progress":
+                _, _, steps, success_fraction = update
+                last_time, last_steps = self.last_progress
+                if now>last_time:
+                    self.status["steps_per_sec"] = (steps-last_steps)/(now-last_time)
+                self.last_progress = (now, steps)
+                self.status.update({"steps": steps, "success_fraction": success_fraction, "eta": self.eta(now)})
+                message = dict(self.status, event=kind)
+
+            else:  # trial_finished
+                _, _, steps = update
+                duration = now - self.trial_start_time
+                self.trial_start_time = None
+                self.trial_durations.append(duration)
+                self.status.update({"steps": steps, "success_fraction": None, "trials_finished": len(self.trial_durations), "eta": self.eta(now)})
+                message = {"event": kind, "target": self.status["target"], "trial": self.status["trial"], "agents": self.status["agents"],
+                           "steps": steps, "duration": duration, "trials_finished": len(self.trial_durations), "trials_total": self.num_trials, "eta": self.status["eta"]}
+
+            self.publish(message)
+
+    def eta(self, now):
+        """Estimated seconds until every trial is finished, from the average trial duration so far"""
+        if not self.trial_durations:
+            return None
+        mean_duration = sum(self.trial_durations)/len(self.trial_durations)
+        remaining = (self.num_trials - len(self.trial_durations)) * mean_duration
+        if self.trial_start_time is not None:
+            remaining -= min(now - self.trial_start_time, mean_duration)  # part of the current trial is already done
+        return max(remaining, 0.)
+
+    def publish(self, message):
+        for subscriber in self.subscribers:
+            if subscriber.full():  # a stalled subscriber only misses old messages, instead of holding every update
+                subscriber.get_nowait()
+            subscriber.put_nowait(message)
+
+    async def handle(self, reader, writer):
+        """Answer one HTTP request"""
+        self.handlers.add(asyncio.current_task())
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):  # skip headers
+                pass
+            path = request.split()[1].decode() if len(request.split())>1 else ''
+
+            if path=='/status':
+                body = json.dumps(self.status).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body)
+
+            elif path=='/events':
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n")
+                subscriber = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+                self.subscribers.add(subscriber)
+                try:
+                    while True:
+                        message = await subscriber.get()
+                        if message is None:
+                            break
+                        writer.write(b"data: " + json.dumps(message).encode() + b"\n\n")
+                        await writer.drain()
+                finally:
+                    self.subscribers.discard(subscriber)
+
+            else:
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # subscriber went away
+        finally:
+            writer.close()
+            self.handlers.discard(asyncio.current_task())
@@ -0,0 +1,271 @@
+import os
+import csv
+import json
+import time
+import shutil
+import socket
+import sqlite3
+import threading
+import traceback
+import multiprocessing
+import click
+import numpy as np
+
+import main as main
+import graph_generation as graph_gen
+from progress_server import ProgressServer
+
+# Job statuses
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def connect(sweep_path):
+    """Open the job queue of a sweep (a SQLite database on shared storage)"""
+    conn = sqlite3.connect(os.path.join(sweep_path, "queue.db"), timeout=60, isolation_level=None)  # transactions are handled explicitly
+    conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                        id INTEGER PRIMARY KEY,
+                        graph_seed INTEGER NOT NULL,
+                        target TEXT NOT NULL,
+                        spec TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        worker TEXT,
+                        claimed_at REAL,
+                        error TEXT)""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                        file TEXT PRIMARY KEY,  -- path relative to the sweep folder
+                        size INTEGER NOT NULL)""")  # size of each results file when its last merge was committed
+    return conn
+
+
+def create_jobs(sweep_path, num_graphs, num_nodes, num_targets, num_trials, trials_per_job, seed, event_driven):
+    """
+    Split a sweep into self describing jobs and add them to the queue.
+
+    Each job spec holds everything needed to run it on any worker: the seed the
+    graph is generated from, the target, the range of trials and the parameters.
+    """
+    if not os.path.exists(sweep_path):
+        os.makedirs(sweep_path)
+    conn = connect(sweep_path)
+
+    specs = []
+    for graph_seed in range(seed, seed+num_graphs):  # for each graph
+        targets = np.random.RandomState(graph_seed).choice(np.arange(1, num_nodes-1), num_targets, replace=False)  # randomly place the targets at (non-heart) nodes
+        for target in targets:
+            for trial_start in range(0, num_trials, trials_per_job):
+                specs.append({"graph_seed": graph_seed,
+                              "num_nodes": num_nodes,
+                              "target": str(target),
+                              "trial_start": trial_start,
+                              "trial_stop": min(trial_start+trials_per_job, num_trials),
+                              "event_driven": event_driven})
+
+    conn.execute("BEGIN IMMEDIATE")
+    conn.executemany("INSERT INTO jobs (graph_seed, target, spec, status) VALUES (?, ?, ?, ?)",
+                     [(spec["graph_seed"], spec["target"], json.dumps(spec), PENDING) for spec in specs])
+    conn.execute("COMMIT")
+    conn.close()
+    print(f"Added {len(specs)} jobs to {sweep_path}")
+
+
+def claim_job(conn, worker, max_attempts, job_timeout):
+    """Atomically claim the next pending job (or a job whose worker stopped responding)"""
+    conn.execute("BEGIN IMMEDIATE")  # lock the queue for writing so no other worker can claim the same job
+    conn.execute("UPDATE jobs SET status=?, error=? WHERE status=? AND claimed_at<? AND attempts>=?",
+                 (FAILED, "worker lost", RUNNING, time.time()-job_timeout, max_attempts))  # lost on its last attempt
+    row = conn.execute("""SELECT id, spec FROM jobs
+                          WHERE (status=? OR (status=? AND claimed_at<?)) AND attempts<?
+                          ORDER BY id LIMIT 1""",
+                       (PENDING, RUNNING, time.time()-job_timeout, max_attempts)).fetchone()
+    if row is not None:
+        conn.execute("UPDATE jobs SET status=?, attempts=attempts+1, worker=?, claimed_at=? WHERE id=?",
+                     (RUNNING, worker, time.time(), row[0]))
+    conn.execute("COMMIT")
+
+    if row is None:
+        return None, None
+    return row[0], json.loads(row[1])
+
+
+def run_job(spec, output_path, progress=None):
+    """Regenerate the graph of a job and run its trials, saving results to output_path
+    (and reporting live progress to progress, a progress_server.ProgressServer, if given)"""
+    np.random.seed(spec["graph_seed"])  # the same seed generates the same graph on every worker
+    G, g, entropy, A, paths, max_cycle_length = graph_gen.create_graph(spec["num_nodes"])
+    split_dict, splits, B, policy_bits, transitions, node_policies, full_policies, policy_paths = main.generate_policies(g)
+
+    target = spec["target"]
+    q_list, N_list = main.calculate_parameters(A, spec["num_nodes"])
+    q, N = float(q_list[int(target)]), int(N_list[int(target)])
+
+    np.random.seed([spec["graph_seed"], int(target), spec["trial_start"]])  # make the trials of each job reproducible
+    simulate = main.run_event_simulation if spec["event_driven"] else main.run_simulation
+    for trial in range(spec["trial_start"], spec["trial_stop"]):
+        if progress is not None:
+            progress.trial_started(target, trial, N)
+        target_count = simulate(spec["num_nodes"], G, g, A, split_dict, B, splits, policy_bits, transitions, node_policies, full_policies, policy_paths, paths, target, q, N, trial==spec["trial_start"], output_path, progress)
+        if progress is not None:
+            progress.trial_finished(len(target_count))
+
+
+def merge_results(conn, sweep_path, graph_seed, job_path):
+    """
+    Append the trials of a finished job to the results files of its graph.
+
+    Files are saved in the same format as main.py, in results/graph_<graph_seed>,
+    so each graph can be plotted with plot_output_data. Call this inside the
+    transaction that marks the job as done, so two workers don't append to the same
+    file at once. The new size of each file is saved in the same transaction, and
+    anything after the saved size (left by a merge that never committed) is cut off
+    first, so a job that is merged again after a crash is only added once.
+    """
+    results_path = os.path.join(sweep_path, "results", f"graph_{graph_seed}")
+    if not os.path.exists(results_path):
+        os.makedirs(results_path, exist_ok=True)
+
+    for file in sorted(os.listdir(job_path)):
+        with open(os.path.join(job_path, file), newline='') as csvfile:
+            rows = list(csv.reader(csvfile, delimiter=' ', quotechar='|'))
+        results_file = os.path.join(results_path, file)
+        name = os.path.relpath(results_file, sweep_path)  # workers may see the shared folder at different paths
+        row = conn.execute("SELECT size FROM results WHERE file=?", (name,)).fetchone()
+        size = 0 if row is None else row[0]
+        if size>0:
+            rows = rows[1:]  # only the first job keeps the graph row
+        with open(results_file, 'a', newline='') as csvfile:
+            csvfile.truncate(size)
+            writer = csv.writer(csvfile, delimiter=' ', quotechar='|', quoting=csv.QUOTE_MINIMAL)
+            writer.writerows(rows)
+        conn.execute("INSERT OR REPLACE INTO results (file, size) VALUES (?, ?)", (name, os.path.getsize(results_file)))
+
+
+def heartbeat(sweep_path, job_id, worker, interval, stop):
+    """Refresh the claim on a job every interval seconds while it runs, so it isn't assumed lost"""
+    conn = connect(sweep_path)
+    while not stop.wait(interval):
+        conn.execute("UPDATE jobs SET claimed_at=? WHERE id=? AND worker=? AND status=?", (time.time(), job_id, worker, RUNNING))
+    conn.close()
+
+
+def fail_job(conn, job_id, worker, max_attempts, error):
+    """Put a job back in the queue after an error, or mark it as failed after its last attempt"""
+    print(error)
+    conn.execute("UPDATE jobs SET status=CASE WHEN attempts<? THEN ? ELSE ? END, error=? WHERE id=? AND worker=?",
+                 (max_attempts, PENDING, FAILED, error, job_id, worker))
+
+
+def work(sweep_path, max_attempts, job_timeout, progress_port=None, progress_socket=None):
+    """Claim and run jobs until the queue is empty"""
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    conn = connect(sweep_path)
+
+    # Optionally stream live progress of this worker's jobs
+    progress = None
+    if progress_port is not None or progress_socket is not None:
+        unix_path = f"{progress_socket}.{worker}" if progress_socket is not None else None
+        progress = ProgressServer(0, port=progress_port, unix_path=unix_path)
+        progress.start()
+
+    while True:
+        job_id, spec = claim_job(conn, worker, max_attempts, job_timeout)
+        if job_id is None:
+            break
+        print(f"\n{worker} running job {job_id}: {spec}")
+        if progress is not None:
+            progress.add_trials(spec["trial_stop"]-spec["trial_start"])
+
+        # Run in a folder of its own, which replaces the output of any earlier attempt
+        job_path = os.path.join(sweep_path, "jobs", str(job_id))
+        temp_path = f"{job_path}.{worker}"
+        shutil.rmtree(temp_path, ignore_errors=True)
+        os.makedirs(temp_path)
+        stop_heartbeat = threading.Event()
+        heartbeat_thread = threading.Thread(target=heartbeat, args=(sweep_path, job_id, worker, job_timeout/4, stop_heartbeat), daemon=True)
+        heartbeat_thread.start()
+        try:
+            run_job(spec, temp_path, progress)
+        except Exception:
+            fail_job(conn, job_id, worker, max_attempts, traceback.format_exc())
+            shutil.rmtree(temp_path, ignore_errors=True)
+            continue
+        finally:
+            stop_heartbeat.set()
+            heartbeat_thread.join()
+
+        # Mark the job as done (if this worker still owns it) and merge it into the results
+        conn.execute("BEGIN IMMEDIATE")
+        owned = conn.execute("UPDATE jobs SET status=?, error=NULL WHERE id=? AND worker=? AND status=?", (DONE, job_id, worker, RUNNING)).rowcount==1
+        if not owned:  # another worker took over the job, so this output is a duplicate
+            conn.execute("COMMIT")
+            shutil.rmtree(temp_path, ignore_errors=True)
+            continue
+        try:
+            shutil.rmtree(job_path, ignore_errors=True)
+            os.replace(temp_path, job_path)
+            merge_results(conn, sweep_path, spec["graph_seed"], job_path)
+        except Exception:  # leave the results as they were committed, and try the job again
+            conn.execute("ROLLBACK")
+            fail_job(conn, job_id, worker, max_attempts, traceback.format_exc())
+            shutil.rmtree(temp_path, ignore_errors=True)
+            continue
+        conn.execute("COMMIT")
+
+    if progress is not None:
+        progress.stop()
+    conn.close()
+
+
+@click.group()
+def cli():
+    """Run a sweep over many graphs, targets and trials with any number of workers"""
+
+
+@cli.command()
+@click.option('--sweep_path', required=True, help='Shared folder for the job queue and results.')
+@click.option('--num_graphs', default=10, help='The number of randomly generated graphs.')
+@click.option('--num_nodes', default=10, help='The number of nodes in each graph.')
+@click.option('--num_targets', default=1, help='The number of targets per graph. Must be less than n-1 (n = number of nodes).')
+@click.option('--num_trials', default=10, help='The number of simulations to run for each target.')
+@click.option('--trials_per_job', default=5, help='The number of simulations in each job.')
+@click.option('--seed', default=0, help='Seed of the first graph. Graph k is generated from seed+k.')
+@click.option('--event_driven', is_flag=True, default=False, help='Flag to use the event driven simulation.')
+def create(sweep_path, num_graphs, num_nodes, num_targets, num_trials, trials_per_job, seed, event_driven):
+    """Add the jobs of a sweep to the queue"""
+    create_jobs(sweep_path, num_graphs, num_nodes, num_targets, num_trials, trials_per_job, seed, event_driven)
+
+
+@cli.command()
+@click.option('--sweep_path', required=True, help='Shared folder for the job queue and results.')
+@click.option('--num_workers', default=1, help='The number of worker processes to start on this machine.')
+@click.option('--max_attempts', default=3, help='The number of times a job is tried before it is marked as failed.')
+@click.option('--job_timeout', default=3600., help='Seconds after which a running job is assumed lost and run again.')
+@click.option('--progress_port', default=None, type=int, help='Stream live progress over HTTP, with worker k on local port progress_port+k (0 = any free port).')
+@click.option('--progress_socket', default=None, help='Stream live progress over HTTP, with each worker on a Unix socket at this path followed by its worker id.')
+def worker(sweep_path, num_workers, max_attempts, job_timeout, progress_port, progress_socket):
+    """Run jobs from the queue until it is empty"""
+    ports = [progress_port+k if progress_port else progress_port for k in range(num_workers)]  # a port per process
+    processes = [multiprocessing.Process(target=work, args=(sweep_path, max_attempts, job_timeout, ports[k], progress_socket)) for k in range(num_workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+@cli.command()
+@click.option('--sweep_path', required=True, help='Shared folder for the job queue and results.')
+def status(sweep_path):
+    """Print the number of jobs with each status"""
+    conn = connect(sweep_path)
+    for job_status, count in conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+        print(f"{job_status}: {count}")
+    for job_id, error in conn.execute("SELECT id, error FROM jobs WHERE status=?", (FAILED,)):
+        print(f"\nJob {job_id} failed:\n{error}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    cli()
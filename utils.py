@@ -29,23 +29,17 @@ def count_policies(num_splits,policy_bits,full_policies,S):
     return count_dict
 
 
-def find_target_policies(policy_paths,target_node):
-    """Find which policies will bypass the target (for printing)"""
-
-    target_policies = []
-
-    for pol in policy_paths:
-        for node in policy_paths[pol]:
-            if node in target_node:
-                target_policies.append(pol)
-                break
-    return target_policies
-
-
 def communication(S, current_nodes, agent_target_count, delta, splits, policy_bits, g, transitions, node):
     """Run through communication step of algorithm"""
     indices = [n for n, x in enumerate(current_nodes) if x==node]   # find indices of other agents at the current node
+    S, agent_target_count = communicate_group(S, indices, agent_target_count, delta, splits, policy_bits, g, transitions)
+    output = [S, agent_target_count, indices]
+
+    return output
+
 
+def communicate_group(S, indices, agent_target_count, delta, splits, policy_bits, g, transitions):
+    """Communicate between every pair of agents in a group of co-located agents"""
     list_to_comm_with = indices.copy()
 
     for j in indices:
@@ -72,31 +66,26 @@ def communication(S, current_nodes, agent_target_count, delta, splits, policy_bi
                             agent_target_count[k]=False  # lose target policy count (if it had it)
                         S[k,0:-1] = S[j,0:-1]  # communicate policy, WITH NO ERROR
                         S[k,-1] = delta  # reset success bit (but give them a lap or two to find the target)
-    output = [S, agent_target_count, indices]
 
-    return output
+    return S, agent_target_count
+
+
+def chance_of_targets(A):
+    """
+    Calculate q for a target at every node at once, from the adjacency matrix.
 
+    q is the chance that a random policy passes a node before returning to the
+    heart node '0'. Nodes only step forward (or back to '0'), so q can be found
+    in one pass through the nodes in order, instead of walking every policy path.
+    """
+    A = np.asarray(A, dtype=float)
+    out_degree = A.sum(axis=1)
+    P = A/out_degree[:,None]  # chance of taking each outgoing edge
+    P[:,0] = 0  # stop when returning to the heart node
 
-def chance_of_target(g, policy_paths, target):
-    """Calculate q, the chance of finding the target based on the graph and target node"""
-    target_paths=[]
-    for pol in policy_paths:
-        path=[]
-        for node in policy_paths[pol]:
-            path.append(node)
-            if node==target and path not in target_paths:
-                target_paths.append(path)
-                break
-            elif int(node)>=int(target):
-                break
-
-    q=0 # chance of visiting the target node
-    for path in target_paths:
-        prob = 1 # chance of visiting the next node along this path
-        for node in path:
-            if node != target:
-                out_degree = len(g[node])
-                prob = prob * (1/out_degree)
-        q += prob
+    q = np.zeros(len(A))
+    q[0] = 1  # every policy starts at the heart node
+    for node in range(len(A)):  # each node's q is final once every node before it has been visited
+        q += q[node]*P[node]
 
     return q